@@ -1,5 +1,5 @@
 import tkinter as tk
-from tkinter import font, filedialog, messagebox, ttk, colorchooser
+from tkinter import font, filedialog, messagebox, ttk, colorchooser, simpledialog
 import json
 from PIL import Image, ImageDraw, ImageFont, ImageTk
 import barcode
@@ -8,6 +8,10 @@ import io
 import os
 import sys
 import math
+import copy
+import hashlib
+import re
+from collections import OrderedDict
 
 # --- 全局配置 (默认值) ---
 DEFAULT_CANVAS_WIDTH = 800
@@ -15,6 +19,311 @@ DEFAULT_CANVAS_HEIGHT = 400
 BACKGROUND_COLOR = "#FFFFFF"
 HIGHLIGHT_COLOR = "#DDEEFF" # 用于高亮选定元素行的颜色
 SELECTION_BORDER_COLOR = "#CC0000" # 用于拖拽时高亮选框的颜色
+DEFAULT_CONFIG = {
+    "jp_font": "Meiryo", "impact_font": "Impact", "tax_rate": 10.0,
+    "strikethrough": True, "price_area_color": "#ffffff",
+    "export_width": DEFAULT_CANVAS_WIDTH, "export_height": DEFAULT_CANVAS_HEIGHT, "show_border": True
+}
+
+# --- 模板库与预编译缓存 ---
+TEMPLATE_LIBRARY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+COMPILED_TEMPLATE_VERSION = 1 # 预编译格式变化时递增，作为缓存键的一部分
+COMPILED_MEMORY_CACHE_SIZE = 64
+STATIC_LAYER_CACHE_SIZE = 8
+BARCODE_CACHE_SIZE = 128
+ANCHOR_MAP = { "n": "mt", "ne": "rt", "e": "rm", "se": "rb", "s": "mb", "sw": "lb", "w": "lm", "nw": "lt", "center": "mm" }
+IMPACT_FONT_KEYS = ('used_label', 'final_price')
+
+_font_cache = {}
+_compiled_cache = OrderedDict()
+_static_layer_cache = OrderedDict()
+_barcode_cache = OrderedDict()
+
+def _lru_get(cache, key, factory, max_size):
+    """从 OrderedDict 实现的 LRU 缓存中取值，未命中时调用 factory() 生成"""
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+    value = cache[key] = factory()
+    if len(cache) > max_size: cache.popitem(last=False)
+    return value
+
+def clear_render_caches():
+    """清空字体、预编译模板、静态底图和条码缓存 (回归测试测量冷启动耗时时使用)"""
+    for cache in (_font_cache, _compiled_cache, _static_layer_cache, _barcode_cache): cache.clear()
+
+def find_system_fonts():
+    """在系统字体目录中查找推荐字体，返回 (font_map, 日文字体列表, Impact字体列表)"""
+    font_dirs = []
+    if sys.platform == "win32":
+        font_dirs.append(os.path.join(os.environ.get("SystemRoot", "C:/Windows"), "Fonts"))
+    elif sys.platform == "darwin":
+        font_dirs.extend(["/System/Library/Fonts", "/Library/Fonts", os.path.expanduser("~/Library/Fonts")])
+    else: # Linux
+        font_dirs.extend(["/usr/share/fonts", "/usr/local/share/fonts", os.path.expanduser("~/.fonts")])
+    jp_fonts_map = {"Meiryo": ["meiryo.ttc", "meiryob.ttc"], "MS Gothic": ["msgothic.ttc"], "Yu Gothic": ["yugothib.ttf"]}
+    impact_fonts_map = {"Impact": ["impact.ttf"], "Arial Black": ["ariblk.ttf"]}
+    font_map = {}
+    def search_fonts(font_dict):
+        found_names = []
+        for name, filenames in font_dict.items():
+            if name in font_map: continue
+            for d in font_dirs:
+                for filename in filenames:
+                    font_path = os.path.join(d, filename)
+                    if os.path.exists(font_path):
+                        font_map[name] = font_path
+                        found_names.append(name)
+                        break
+                if name in font_map: break
+        return found_names
+    available_jp_fonts = search_fonts(jp_fonts_map)
+    available_impact_fonts = search_fonts(impact_fonts_map)
+    return font_map, available_jp_fonts, available_impact_fonts
+
+def load_font(font_path, font_size):
+    """按 (路径, 字号) 缓存字体对象；font_path 为 None 时使用 Pillow 默认字体"""
+    cache_key = (font_path, font_size)
+    if cache_key not in _font_cache:
+        _font_cache[cache_key] = ImageFont.truetype(font_path, font_size) if font_path else ImageFont.load_default()
+    return _font_cache[cache_key]
+
+def _resolve_font_path(font_family, font_size, font_map, fallback_font_path):
+    """按 字体名 -> 回退字体 -> 默认字体 的顺序确定实际可用的字体文件"""
+    for candidate in (font_map.get(font_family) or font_family, fallback_font_path):
+        if not candidate: continue
+        try:
+            load_font(candidate, font_size)
+            return candidate
+        except (IOError, OSError): continue
+    return None
+
+def get_element_text(key, info, base_price, tax, total_price):
+    if key.startswith("custom_text_"): return info.get(key, "")
+    text_map = {'cat1': info['cat1'], 'code': f"{info['code']}", 'cat2': info['cat2'], 'title': info['title'], 'list_price': f"定価 ¥{int(info.get('list_price', 0)):,}", 'used_label': "USED", 'tax_date_label': "税込", 'tax_date_value': info['tax_date'], 'release_date': f"発売日 {info['sale_date']}", 'price_breakdown': f"(本体¥{base_price:,} + 税¥{tax:,})", 'final_price': f"¥{total_price:,}"}
+    return text_map.get(key, "")
+
+def template_hash(template_data):
+    """模板内容的哈希值 (与键顺序、缩进无关)"""
+    canonical = json.dumps(template_data, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def compiled_template_key(content_hash, font_map, fallback_font_path):
+    """预编译结果的缓存键：模板内容 + 字体解析环境 + 预编译格式版本"""
+    fonts = json.dumps([sorted(font_map.items()), fallback_font_path], ensure_ascii=False)
+    return hashlib.sha256(f"{COMPILED_TEMPLATE_VERSION}|{content_hash}|{fonts}".encode('utf-8')).hexdigest()
+
+def compile_template(template_data, font_map, fallback_font_path=None, key=None):
+    """
+    把模板预编译为与界面无关的渲染计划：
+    - 解析并校验所有数值，确定每个文本元素实际使用的字体文件；
+    - 取得不随数据变化的静态图层 (底色、价格区、边界线)，相同配置的模板共用同一图层；
+    - 按绘制顺序排好元素。
+    导出尺寸无效时抛出 ValueError。
+    """
+    config = dict(DEFAULT_CONFIG, **template_data.get('config', {}))
+    export_width, export_height = int(config['export_width']), int(config['export_height'])
+    static_layer = _get_static_layer(export_width, export_height, config['price_area_color'], bool(config['show_border']))
+    try: tax_rate = float(config['tax_rate'])
+    except (ValueError, TypeError): tax_rate = None
+    plan = []
+    sorted_elements = sorted(template_data.get('elements', {}).items(), key=lambda item: 0 if item[0] == 'barcode' else 1)
+    for elem_key, props in sorted_elements:
+        try:
+            x, y = int(props['pos'][0]), int(props['pos'][1])
+            if elem_key == 'barcode':
+                w, h = int(props['size'][0]), int(props['size'][1])
+                if w <= 0 or h <= 0: continue
+                plan.append({"key": elem_key, "kind": "barcode", "pos": (x, y), "size": (w, h)})
+                continue
+            font_size = int(props['font_size'])
+            if font_size <= 0: continue
+            font_family_name = config['impact_font'] if elem_key in IMPACT_FONT_KEYS else config['jp_font']
+            anchor = props.get('anchor', 'nw')
+            try: line_spacing = float(props.get('line_spacing', 1.0))
+            except (ValueError, TypeError): line_spacing = 1.0
+            plan.append({
+                "key": elem_key, "kind": "text", "pos": (x, y),
+                "font_path": _resolve_font_path(font_family_name, font_size, font_map, fallback_font_path),
+                "font_size": font_size, "fill": "gray" if elem_key == 'list_price' else "black",
+                "anchor": anchor, "pil_anchor": ANCHOR_MAP.get(anchor, "lt"),
+                "vertical": bool(props.get('vertical')), "line_spacing": line_spacing,
+                "strikethrough": elem_key == 'list_price' and bool(config['strikethrough'])
+            })
+        except Exception as e: print(f"导出元素'{elem_key}'时出错: {e}")
+    return {
+        "key": key or compiled_template_key(template_hash(template_data), font_map, fallback_font_path),
+        "template": template_data, "size": (export_width, export_height), "tax_rate": tax_rate,
+        "elements": plan, "static_layer": static_layer
+    }
+
+def _get_static_layer(export_width, export_height, price_area_color, show_border):
+    """静态图层只取决于尺寸、价格区底色和边界线，按这几项缓存；调用方只能复制后使用"""
+    def draw_layer():
+        layer = Image.new('RGBA', (export_width, export_height), BACKGROUND_COLOR)
+        draw = ImageDraw.Draw(layer)
+        draw.rectangle([(20, 200), (export_width - 20, export_height - 20)], fill=price_area_color)
+        if show_border:
+            draw.rectangle([(0, 0), (export_width - 1, export_height - 1)], outline="gray", width=1)
+        return layer
+    return _lru_get(_static_layer_cache, (export_width, export_height, price_area_color, show_border), draw_layer, STATIC_LAYER_CACHE_SIZE)
+
+def get_compiled_template(template_data, font_map, fallback_font_path=None):
+    """
+    带内存缓存的 compile_template。缓存键只包含布局 (config 与 elements)，
+    信息字段在渲染时传入，因此编辑商品信息不会产生新的缓存项。
+    """
+    layout = {k: template_data.get(k, {}) for k in ('config', 'elements')}
+    key = compiled_template_key(template_hash(layout), font_map, fallback_font_path)
+    return _lru_get(_compiled_cache, key, lambda: compile_template(template_data, font_map, fallback_font_path, key=key), COMPILED_MEMORY_CACHE_SIZE)
+
+def render_compiled_template(compiled, info=None):
+    """
+    用预编译模板渲染贴纸，返回 (image, element_bboxes)。
+    info 中的字段会覆盖模板自带的信息，便于批量套用数据行。
+    """
+    merged_info = dict(compiled['template'].get('info', {}))
+    if info: merged_info.update(info)
+    image = compiled['static_layer'].copy()
+    draw = ImageDraw.Draw(image)
+    element_bboxes = {}
+    try:
+        base_price = int(merged_info.get('used_price_base', 0))
+        tax_rate = compiled['tax_rate'] / 100
+        tax = math.floor(base_price * tax_rate)
+        total_price = base_price + tax
+    except (ValueError, TypeError): base_price, tax, total_price = 0, 0, 0
+    for element in compiled['elements']:
+        try:
+            if element['kind'] == 'text':
+                text_to_draw = get_element_text(element['key'], merged_info, base_price, tax, total_price)
+                bbox = _draw_text_element(draw, element, text_to_draw)
+            else:
+                bbox = _draw_barcode_element(image, element, merged_info)
+            if bbox: element_bboxes[element['key']] = bbox
+        except Exception as e: print(f"导出元素'{element['key']}'时出错: {e}")
+    return image, element_bboxes
+
+def _draw_text_element(draw, element, text):
+    x, y = element['pos']
+    anchor, pil_anchor, fill = element['anchor'], element['pil_anchor'], element['fill']
+    current_font = load_font(element['font_path'], element['font_size'])
+    if not element['vertical']:
+        bbox = draw.textbbox((x, y), text, font=current_font, anchor=pil_anchor)
+        draw.text((x, y), text, font=current_font, fill=fill, anchor=pil_anchor)
+        if element['strikethrough']:
+            draw.line([(bbox[0], (bbox[1]+bbox[3])/2), (bbox[2], (bbox[1]+bbox[3])/2)], fill=fill, width=2)
+        return bbox
+    else:
+        line_height = element['font_size'] * element['line_spacing']
+        total_height = (len(text) - 1) * line_height
+        start_y = y
+        if 's' in anchor: start_y = y - total_height
+        elif 'center' in anchor or 'm' in pil_anchor: start_y = y - total_height / 2
+        overall_bbox = [float('inf'), float('inf'), float('-inf'), float('-inf')]
+        for i, char in enumerate(text):
+            char_y = start_y + i * line_height
+            char_pil_anchor = "m" + pil_anchor[1]
+            char_bbox = draw.textbbox((x, char_y), char, font=current_font, anchor=char_pil_anchor)
+            draw.text((x, char_y), char, font=current_font, fill=fill, anchor=char_pil_anchor)
+            overall_bbox[0], overall_bbox[1] = min(overall_bbox[0], char_bbox[0]), min(overall_bbox[1], char_bbox[1])
+            overall_bbox[2], overall_bbox[3] = max(overall_bbox[2], char_bbox[2]), max(overall_bbox[3], char_bbox[3])
+        return tuple(overall_bbox)
+
+def _draw_barcode_element(image, element, info):
+    barcode_content = info.get('barcode_data', '')
+    if not barcode_content: return None
+    try:
+        x, y = element['pos']
+        w, h = element['size']
+        barcode_img = _lru_get(_barcode_cache, (barcode_content, w, h), lambda: _generate_barcode_image(barcode_content, w, h), BARCODE_CACHE_SIZE)
+        paste_x, paste_y = int(x - w / 2), int(y - h / 2)
+        image.paste(barcode_img, (paste_x, paste_y), barcode_img)
+        return (paste_x, paste_y, paste_x + w, paste_y + h)
+    except Exception as e:
+        print(f"导出条码时出错: {e}")
+        return None
+
+def _generate_barcode_image(barcode_content, w, h):
+    EAN = barcode.get_barcode_class('code128')
+    buffer = io.BytesIO()
+    options = {'module_height': 15.0, 'quiet_zone': 2.0, 'write_text': False}
+    EAN(barcode_content, writer=ImageWriter()).write(buffer, options=options)
+    buffer.seek(0)
+    return Image.open(buffer).convert("RGBA").resize((w, h), Image.Resampling.LANCZOS)
+
+class TemplateLibrary:
+    """
+    模板库：一个目录下存放多个 JSON 模板，并由 index.json 记录每个模板的文件与内容哈希。
+    预编译结果以 内容哈希 + 字体环境 + COMPILED_TEMPLATE_VERSION 为键缓存在内存中，
+    再次切换到同一模板时无需读取文件或重新编译。
+    """
+    INDEX_FILE = "index.json"
+    _ID_PATTERN = re.compile(r"[\w-]+")
+
+    def __init__(self, root_dir=TEMPLATE_LIBRARY_DIR):
+        self.root_dir = root_dir
+        self.index_path = os.path.join(root_dir, self.INDEX_FILE)
+        self.index = self._read_index()
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (IOError, OSError, ValueError):
+            index = {}
+        index.setdefault("templates", {})
+        return index
+
+    def _write_json(self, path, data, indent=None):
+        """先写临时文件再替换，避免中断时留下半个文件"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+        os.replace(tmp_path, path)
+
+    def _entry(self, template_id):
+        try: return self.index["templates"][template_id]
+        except KeyError: raise KeyError(f"模板库中没有ID为 '{template_id}' 的模板") from None
+
+    def _template_path(self, template_id):
+        return os.path.join(self.root_dir, self._entry(template_id)["file"])
+
+    def list_templates(self):
+        return sorted(self.index["templates"])
+
+    def save(self, template_id, template_data):
+        if not self._ID_PATTERN.fullmatch(template_id):
+            raise ValueError(f"模板ID只能包含字母、数字、下划线和连字符: {template_id}")
+        filename = f"{template_id}.json"
+        path = os.path.join(self.root_dir, filename)
+        self._write_json(path, template_data, indent=4)
+        stat = os.stat(path)
+        self.index["templates"][template_id] = {"file": filename, "hash": template_hash(template_data), "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+        self._write_json(self.index_path, self.index, indent=4)
+
+    def load(self, template_id):
+        with open(self._template_path(template_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def content_hash(self, template_id):
+        """返回模板的内容哈希；若文件在库外被修改过 (mtime/大小变化)，重新计算并更新索引"""
+        entry = self._entry(template_id)
+        stat = os.stat(self._template_path(template_id))
+        if entry.get("mtime_ns") != stat.st_mtime_ns or entry.get("size") != stat.st_size:
+            entry.update(hash=template_hash(self.load(template_id)), mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+            self._write_json(self.index_path, self.index, indent=4)
+        return entry["hash"]
+
+    def compiled(self, template_id, font_map, fallback_font_path=None):
+        """取得预编译模板，内存中没有时读取模板文件并编译"""
+        key = compiled_template_key(self.content_hash(template_id), font_map, fallback_font_path)
+        return _lru_get(_compiled_cache, key, lambda: compile_template(self.load(template_id), font_map, fallback_font_path, key=key), COMPILED_MEMORY_CACHE_SIZE)
+
+    def render(self, template_id, font_map, fallback_font_path=None, info=None):
+        """按模板ID渲染贴纸，供批量生成使用"""
+        return render_compiled_template(self.compiled(template_id, font_map, fallback_font_path), info)
 
 class StickerGenerator:
     """
@@ -48,10 +357,8 @@ class StickerGenerator:
         self.handle_size = 8        # 控制柄在画布上的显示大小
 
         # --- 字体管理 ---
-        self.font_map = {}
-        self.available_jp_fonts = []
-        self.available_impact_fonts = []
-        self._find_system_fonts()
+        self.font_map, self.available_jp_fonts, self.available_impact_fonts = find_system_fonts()
+        self.template_library = TemplateLibrary()
         
         if not self.available_jp_fonts:
             messagebox.showwarning("字体警告", "未找到推荐的日文字体。")
@@ -74,11 +381,7 @@ class StickerGenerator:
                 "title": "ソードアート・オンライン abec画集 Wanderers", "list_price": "3080",
                 "used_price_base": "2273", "sale_date": "20.03.27", "tax_date": "24.06.06"
             },
-            "config": {
-                "jp_font": "Meiryo", "impact_font": "Impact", "tax_rate": 10.0,
-                "strikethrough": True, "price_area_color": "#ffffff",
-                "export_width": DEFAULT_CANVAS_WIDTH, "export_height": DEFAULT_CANVAS_HEIGHT, "show_border": True
-            },
+            "config": dict(DEFAULT_CONFIG),
             "elements": {
                 "barcode": {"pos": (408, 47), "size": (300, 70), "font_size": 0, "tag": "barcode", "vertical": False},
                 "cat1": {"pos": (101, 131), "size": (0, 0), "font_size": 24, "tag": "cat1", "anchor": "s", "vertical": False, "line_spacing": 1.1},
@@ -117,32 +420,6 @@ class StickerGenerator:
         }
         self.vars['used_price_base'].trace_add("write", lambda *args: self.update_preview())
 
-    def _find_system_fonts(self):
-        font_dirs = []
-        if sys.platform == "win32":
-            font_dirs.append(os.path.join(os.environ.get("SystemRoot", "C:/Windows"), "Fonts"))
-        elif sys.platform == "darwin":
-            font_dirs.extend(["/System/Library/Fonts", "/Library/Fonts", os.path.expanduser("~/Library/Fonts")])
-        else: # Linux
-            font_dirs.extend(["/usr/share/fonts", "/usr/local/share/fonts", os.path.expanduser("~/.fonts")])
-        jp_fonts_map = {"Meiryo": ["meiryo.ttc", "meiryob.ttc"], "MS Gothic": ["msgothic.ttc"], "Yu Gothic": ["yugothib.ttf"]}
-        impact_fonts_map = {"Impact": ["impact.ttf"], "Arial Black": ["ariblk.ttf"]}
-        def search_fonts(font_dict):
-            found_names = []
-            for name, filenames in font_dict.items():
-                if name in self.font_map: continue
-                for d in font_dirs:
-                    for filename in filenames:
-                        font_path = os.path.join(d, filename)
-                        if os.path.exists(font_path):
-                            self.font_map[name] = font_path
-                            found_names.append(name)
-                            break
-                    if name in self.font_map: break
-            return found_names
-        self.available_jp_fonts = search_fonts(jp_fonts_map)
-        self.available_impact_fonts = search_fonts(impact_fonts_map)
-
     def _create_styles(self):
         s = ttk.Style()
         s.configure('TLabel', font=('Helvetica', 11))
@@ -168,6 +445,13 @@ class StickerGenerator:
         ttk.Button(file_frame, text="载入模板", command=self.load_template).pack(side=tk.LEFT, expand=True, fill=tk.X, padx=2)
         ttk.Button(file_frame, text="保存模板", command=self.save_template).pack(side=tk.LEFT, expand=True, fill=tk.X, padx=2)
         ttk.Button(file_frame, text="导出图片", command=self.export_as_image).pack(side=tk.LEFT, expand=True, fill=tk.X, padx=2)
+        library_frame = ttk.LabelFrame(controls_frame, text="模板库", padding=10)
+        library_frame.pack(side=tk.TOP, fill=tk.X, pady=5)
+        self.library_var = tk.StringVar()
+        self.library_combo = ttk.Combobox(library_frame, textvariable=self.library_var, values=self.template_library.list_templates(), state='readonly')
+        self.library_combo.pack(side=tk.LEFT, expand=True, fill=tk.X, padx=2)
+        self.library_combo.bind('<<ComboboxSelected>>', lambda e: self.switch_library_template(self.library_var.get()))
+        ttk.Button(library_frame, text="存入模板库", command=self.save_to_library).pack(side=tk.LEFT, padx=2)
         info_frame = ttk.LabelFrame(controls_frame, text="主要信息", padding=10)
         info_frame.pack(side=tk.TOP, fill=tk.X, pady=5)
         info_fields = [("分类1:", "cat1"), ("商品ID:", "code"), ("条码内容:", "barcode_data"), ("分类2:", "cat2"), ("作品名:", "title"), ("定价(円):", "list_price"), ("本体售价(円):", "used_price_base"), ("发售日:", "sale_date"), ("打印日期:", "tax_date")]
@@ -402,11 +686,6 @@ class StickerGenerator:
             self.transform_handles[name] = h_bbox
             self.preview_canvas.create_rectangle(h_bbox, fill=SELECTION_BORDER_COLOR, outline='white', tags="selection_highlight")
 
-    def _get_element_text(self, key, info, base_price, tax, total_price):
-        if key.startswith("custom_text_"): return info.get(key, "")
-        text_map = {'cat1': info['cat1'], 'code': f"{info['code']}", 'cat2': info['cat2'], 'title': info['title'], 'list_price': f"定価 ¥{int(info.get('list_price', 0)):,}", 'used_label': "USED", 'tax_date_label': "税込", 'tax_date_value': info['tax_date'], 'release_date': f"発売日 {info['sale_date']}", 'price_breakdown': f"(本体¥{base_price:,} + 税¥{tax:,})", 'final_price': f"¥{total_price:,}"}
-        return text_map.get(key, "")
-    
     def _highlight_widget(self):
         for key, value in self.pos_widgets.items():
             value['label'].configure(style='Highlight.TLabel' if key in self.selection else 'Normal.TLabel')
@@ -535,9 +814,8 @@ class StickerGenerator:
         self._drag_data = {}
         self.preview_canvas.config(cursor="arrow") # 恢复默认光标
 
-    def save_template(self):
-        filepath = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON模板", "*.json")], title="保存模板")
-        if not filepath: return
+    def _sync_element_props(self):
+        """把界面上的元素参数写回 self.data['elements']，有无效值时提示并返回 False"""
         for key, props in self.data['elements'].items():
             try:
                 props['pos'] = (int(self.element_vars[key]['x'].get()), int(self.element_vars[key]['y'].get()))
@@ -547,7 +825,29 @@ class StickerGenerator:
                 if props.get('vertical'): props['line_spacing'] = float(self.element_vars[key]['line_spacing'].get())
             except (ValueError, tk.TclError, KeyError):
                 messagebox.showerror("错误", f"元素 '{key}' 的值无效。")
-                return
+                return False
+        return True
+
+    def _collect_template_data(self):
+        """收集界面上的当前值作为模板数据 (不做校验，无效值由 compile_template 逐项跳过)"""
+        config = {}
+        for key, var in self.config_vars.items():
+            try: config[key] = var.get()
+            except tk.TclError: config[key] = None
+        elements = {}
+        for key, props in self.data['elements'].items():
+            if key not in self.element_vars: continue
+            ev = {k: v.get() for k, v in self.element_vars[key].items()}
+            elements[key] = {"pos": (ev['x'], ev['y']), "size": (ev['w'], ev['h']), "font_size": ev['font_size'], "anchor": props.get('anchor', 'nw'), "vertical": ev['vertical'] == "竖排", "line_spacing": ev['line_spacing']}
+        return {"info": {k: v.get() for k, v in self.vars.items()}, "config": config, "elements": elements}
+
+    def _fallback_font_path(self):
+        return self.font_map.get(self.available_jp_fonts[0]) if self.available_jp_fonts else None
+
+    def save_template(self):
+        filepath = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON模板", "*.json")], title="保存模板")
+        if not filepath: return
+        if not self._sync_element_props(): return
         template_data = {"info": {k: v.get() for k, v in self.vars.items()}, "config": {k: v.get() for k, v in self.config_vars.items()}, "elements": self.data['elements']}
         try:
             with open(filepath, 'w', encoding='utf-8') as f:
@@ -555,22 +855,66 @@ class StickerGenerator:
             messagebox.showinfo("成功", f"模板已保存到:\n{filepath}")
         except Exception as e: messagebox.showerror("保存失败", f"无法保存模板: {e}")
 
+    def save_to_library(self):
+        template_id = simpledialog.askstring("存入模板库", "模板ID (字母、数字、下划线、连字符):", initialvalue=self.library_var.get(), parent=self.root)
+        if not template_id: return
+        if not self._sync_element_props(): return
+        template_data = {"info": {k: v.get() for k, v in self.vars.items()}, "config": {k: v.get() for k, v in self.config_vars.items()}, "elements": self.data['elements']}
+        try:
+            self.template_library.save(template_id, template_data)
+            self.template_library.compiled(template_id, self.font_map, self._fallback_font_path())
+        except Exception as e:
+            messagebox.showerror("保存失败", f"无法存入模板库: {e}")
+            return
+        self.library_combo.config(values=self.template_library.list_templates())
+        self.library_var.set(template_id)
+
+    def switch_library_template(self, template_id):
+        """从模板库切换模板：使用预编译缓存，元素结构相同时直接复用现有的输入行"""
+        try:
+            compiled = self.template_library.compiled(template_id, self.font_map, self._fallback_font_path())
+            self._apply_template_data(compiled['template'])
+        except Exception as e:
+            messagebox.showerror("加载失败", f"无法载入模板 '{template_id}': {e}")
+
+    def _apply_template_data(self, template_data):
+        template_data = copy.deepcopy(template_data)
+        elements = template_data.get("elements", {})
+        same_layout = list(elements) == list(self.data['elements'])
+        if not same_layout: self._clear_all_custom_fields()
+        self.data['elements'] = elements
+        self.data['info'] = template_data.get("info", {})
+        config = template_data.get("config", {})
+        for key, var in self.config_vars.items(): var.set(config.get(key, DEFAULT_CONFIG[key])) # 模板中缺少的配置项恢复为默认值
+        # 复用已有的变量，使已绑定的输入框保持同步
+        for key in [k for k in self.vars if k not in self.data['info']]: del self.vars[key]
+        for key, val in self.data['info'].items():
+            if key in self.vars: self.vars[key].set(str(val))
+            else: self.vars[key] = tk.StringVar(value=str(val))
+        for key in [k for k in self.element_vars if k not in elements]: del self.element_vars[key]
+        for key, val in elements.items():
+            values = {'x': val['pos'][0], 'y': val['pos'][1], 'w': val['size'][0], 'h': val['size'][1], 'font_size': val['font_size'], 'line_spacing': val.get('line_spacing', 1.0)}
+            if key not in self.element_vars:
+                self.element_vars[key] = {name: tk.StringVar() for name in ('x', 'y', 'w', 'h', 'font_size', 'line_spacing', 'vertical')}
+            ev = self.element_vars[key]
+            for name, v in values.items(): ev[name].set(str(v))
+            ev['vertical'].set("竖排" if val.get('vertical') else "横排")
+        custom_ids = [int(k.split('_')[-1]) for k in elements if k.startswith("custom_text_") and k.split('_')[-1].isdigit()]
+        self.custom_text_counter = max(custom_ids, default=0)
+        if same_layout:
+            for key in elements: self.toggle_line_spacing_widget(key)
+        else:
+            self._build_all_pos_rows()
+        self.color_swatch.config(fg=self.config_vars['price_area_color'].get())
+        self._update_canvas_size()
+
     def load_template(self):
         filepath = filedialog.askopenfilename(filetypes=[("JSON模板", "*.json")], title="载入模板")
         if not filepath: return
         try:
             with open(filepath, 'r', encoding='utf-8') as f:
                 template_data = json.load(f)
-            self._clear_all_custom_fields()
-            self.data['elements'] = template_data.get("elements", {})
-            self.data['info'] = template_data.get("info", {})
-            for key, value in template_data.get("config", {}).items():
-                if key in self.config_vars: self.config_vars[key].set(value)
-            self.vars = {key: tk.StringVar(value=str(val)) for key, val in self.data['info'].items()}
-            self.element_vars = { key: {'x': tk.StringVar(value=str(val['pos'][0])), 'y': tk.StringVar(value=str(val['pos'][1])), 'w': tk.StringVar(value=str(val['size'][0])), 'h': tk.StringVar(value=str(val['size'][1])), 'font_size': tk.StringVar(value=str(val['font_size'])), 'line_spacing': tk.StringVar(value=str(val.get('line_spacing', 1.0))), 'vertical': tk.StringVar(value="竖排" if val.get('vertical') else "横排")} for key, val in self.data['elements'].items()}
-            self._build_all_pos_rows()
-            self.color_swatch.config(fg=self.config_vars['price_area_color'].get())
-            self._update_canvas_size()
+            self._apply_template_data(template_data)
             messagebox.showinfo("成功", "模板加载完毕！")
         except Exception as e:
             messagebox.showerror("加载失败", f"无法解析模板: {e}")
@@ -596,91 +940,11 @@ class StickerGenerator:
         except (ValueError, tk.TclError):
             messagebox.showerror("尺寸错误", "导出尺寸无效。")
             return None, None
-        image = Image.new('RGBA', (export_width, export_height), BACKGROUND_COLOR)
-        draw = ImageDraw.Draw(image)
-        element_bboxes = {}
-        draw.rectangle([(20, 200), (export_width - 20, export_height - 20)], fill=self.config_vars['price_area_color'].get())
-        if self.config_vars['show_border'].get():
-            draw.rectangle([(0, 0), (export_width - 1, export_height - 1)], outline="gray", width=1)
-        info = {k: v.get() for k, v in self.vars.items()}
-        try:
-            base_price = int(info.get('used_price_base', 0))
-            tax_rate = self.config_vars['tax_rate'].get() / 100
-            tax = math.floor(base_price * tax_rate)
-            total_price = base_price + tax
-        except (ValueError, tk.TclError): base_price, tax, total_price = 0, 0, 0
-        sorted_elements = sorted(self.data['elements'].items(), key=lambda item: 0 if item[0] == 'barcode' else 1)
-        for key, props in sorted_elements:
-            try:
-                x, y = int(self.element_vars[key]['x'].get()), int(self.element_vars[key]['y'].get())
-                if key != 'barcode':
-                    font_size = int(self.element_vars[key]['font_size'].get())
-                    if font_size <= 0: continue
-                    font_family_name = self.config_vars['impact_font'].get() if key in ['used_label', 'final_price'] else self.config_vars['jp_font'].get()
-                    text_to_draw = self._get_element_text(key, info, base_price, tax, total_price)
-                    fill_color = "gray" if key == 'list_price' else "black"
-                    is_vertical = self.element_vars[key]['vertical'].get() == "竖排"
-                    anchor = props.get('anchor', 'nw')
-                    bbox = self._draw_text_on_image(draw, key, x, y, text_to_draw, font_family_name, font_size, fill_color, anchor, is_vertical)
-                    if bbox: element_bboxes[key] = bbox
-                else:
-                    bbox = self._draw_barcode_on_image(image, key, x, y, info)
-                    if bbox: element_bboxes[key] = bbox
-            except Exception as e: print(f"导出元素'{key}'时出错: {e}")
-        return image, element_bboxes
-
-    def _draw_text_on_image(self, draw, key, x, y, text, font_family, font_size, fill, anchor, is_vertical):
-        anchor_map = { "n": "mt", "ne": "rt", "e": "rm", "se": "rb", "s": "mb", "sw": "lb", "w": "lm", "nw": "lt", "center": "mm" }
-        pil_anchor = anchor_map.get(anchor, "lt")
-        font_path = self.font_map.get(font_family)
-        try:
-            current_font = ImageFont.truetype(font_path if font_path else font_family, font_size)
-        except (IOError, OSError):
-            fallback_path = self.font_map.get(self.available_jp_fonts[0]) if self.available_jp_fonts else None
-            try: current_font = ImageFont.truetype(fallback_path, font_size) if fallback_path else ImageFont.load_default()
-            except (IOError, OSError): current_font = ImageFont.load_default()
-        if not is_vertical:
-            bbox = draw.textbbox((x, y), text, font=current_font, anchor=pil_anchor)
-            draw.text((x, y), text, font=current_font, fill=fill, anchor=pil_anchor)
-            if key == 'list_price' and self.config_vars['strikethrough'].get():
-                draw.line([(bbox[0], (bbox[1]+bbox[3])/2), (bbox[2], (bbox[1]+bbox[3])/2)], fill=fill, width=2)
-            return bbox
-        else:
-            try: line_spacing_multiplier = float(self.element_vars[key]['line_spacing'].get())
-            except (ValueError, tk.TclError): line_spacing_multiplier = 1.0
-            line_height = font_size * line_spacing_multiplier
-            total_height = (len(text) - 1) * line_height
-            start_y = y
-            if 's' in anchor: start_y = y - total_height
-            elif 'center' in anchor or 'm' in pil_anchor: start_y = y - total_height / 2
-            overall_bbox = [float('inf'), float('inf'), float('-inf'), float('-inf')]
-            for i, char in enumerate(text):
-                char_y = start_y + i * line_height
-                char_pil_anchor = "m" + pil_anchor[1] 
-                char_bbox = draw.textbbox((x, char_y), char, font=current_font, anchor=char_pil_anchor)
-                draw.text((x, char_y), char, font=current_font, fill=fill, anchor=char_pil_anchor)
-                overall_bbox[0], overall_bbox[1] = min(overall_bbox[0], char_bbox[0]), min(overall_bbox[1], char_bbox[1])
-                overall_bbox[2], overall_bbox[3] = max(overall_bbox[2], char_bbox[2]), max(overall_bbox[3], char_bbox[3])
-            return tuple(overall_bbox)
-
-    def _draw_barcode_on_image(self, image, key, x, y, info):
-        barcode_content = info.get('barcode_data', '')
-        if not barcode_content: return None
-        try:
-            w, h = int(self.element_vars[key]['w'].get()), int(self.element_vars[key]['h'].get())
-            if w <= 0 or h <= 0: return None
-            EAN = barcode.get_barcode_class('code128')
-            buffer = io.BytesIO()
-            options = {'module_height': 15.0, 'quiet_zone': 2.0, 'write_text': False}
-            EAN(barcode_content, writer=ImageWriter()).write(buffer, options=options)
-            buffer.seek(0)
-            barcode_img = Image.open(buffer).convert("RGBA").resize((w, h), Image.Resampling.LANCZOS)
-            paste_x, paste_y = int(x - w / 2), int(y - h / 2)
-            image.paste(barcode_img, (paste_x, paste_y), barcode_img)
-            return (paste_x, paste_y, paste_x + w, paste_y + h)
-        except Exception as e:
-            print(f"导出条码时出错: {e}")
-            return None
+        template_data = self._collect_template_data()
+        template_data['config'].update(export_width=export_width, export_height=export_height)
+        info = template_data.pop('info')
+        compiled = get_compiled_template(template_data, self.font_map, self._fallback_font_path())
+        return render_compiled_template(compiled, info)
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,56 @@
+"""
+从 IPAex ゴシック (ipaexg.ttf) 生成回归测试用的子集字体 StickerTestGothic.ttf。
+
+子集包含 ASCII、全部平假名/片假名，以及回归用例 (regression/templates、regression/rows.json)
+和贴纸固定文字中出现的所有字符。依照 IPA フォントライセンス，派生字体改名且不含 "IPA" 字样。
+用例中加入新字符后需重新生成字体并更新参考图：
+    pip install fonttools
+    python regression/fonts/make_test_font.py path/to/ipaexg.ttf
+    python render_regression.py --update
+若要换回原版字体，把 render_regression.py 中 TEST_FONT_MAP 的路径改为 ipaexg.ttf 即可。
+"""
+import json
+import os
+import sys
+from fontTools import subset
+from fontTools.ttLib import TTFont
+
+FONT_DIR = os.path.dirname(os.path.abspath(__file__))
+REGRESSION_DIR = os.path.dirname(FONT_DIR)
+OUTPUT_PATH = os.path.join(FONT_DIR, "StickerTestGothic.ttf")
+FAMILY_NAME = "StickerTestGothic"
+# get_element_text 中写死的文字
+FIXED_TEXT = "定価 ¥,USED税込発売日(本体 + 税)0123456789"
+
+def collect_text():
+    chars = {chr(c) for c in range(0x20, 0x7F)} # ASCII
+    chars |= {chr(c) for c in range(0x3041, 0x3097)} # 平假名
+    chars |= {chr(c) for c in range(0x30A0, 0x3100)} # 片假名
+    chars |= set(FIXED_TEXT)
+    sources = [os.path.join(REGRESSION_DIR, "rows.json")]
+    templates_dir = os.path.join(REGRESSION_DIR, "templates")
+    sources += [os.path.join(templates_dir, f) for f in os.listdir(templates_dir) if f.endswith(".json")]
+    for path in sources:
+        with open(path, 'r', encoding='utf-8') as f:
+            chars |= set(f.read())
+    return "".join(sorted(c for c in chars if c.isprintable()))
+
+def main(source_path):
+    font = TTFont(source_path)
+    options = subset.Options()
+    options.name_IDs = ["*"]
+    options.name_languages = ["*"]
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(text=collect_text())
+    subsetter.subset(font)
+    names = {1: FAMILY_NAME, 3: f"{FAMILY_NAME}-subset", 4: FAMILY_NAME, 6: FAMILY_NAME, 16: FAMILY_NAME, 17: "Regular"}
+    for record in font["name"].names:
+        if record.nameID in names: record.string = names[record.nameID]
+    font.save(OUTPUT_PATH)
+    print(f"已生成 {OUTPUT_PATH} ({os.path.getsize(OUTPUT_PATH)} 字节)")
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+    main(sys.argv[1])
@@ -0,0 +1,438 @@
+"""
+渲染回归与确定性测试。
+
+对 regression/templates 中的每个模板与 regression/rows.json 中的每一行数据的组合进行渲染。
+导出尺寸由模板自身决定 (元素坐标是绝对像素，standard_small / standard_large 是按各自尺寸排好的版式)。
+每个组合分别经过两条路径：直接调用 compile_template / render_compiled_template，
+以及经由界面使用的 StickerGenerator._generate_pillow_image (界面变量由无窗口的 Tcl 解释器承载)；
+另有几个界面路径专用用例，覆盖无效输入时的回退逻辑。对每个用例：
+- 与 regression/golden 中的参考图逐像素比对，默认要求完全一致 (--threshold / --tolerance 可放宽)；
+- 每次冷渲染前清空 main 中的全部缓存，冷渲染之间、以及之后的热渲染 (缓存已填充) 与冷渲染结果都必须逐字节一致；
+- 从渲染结果中解码条形码，内容必须与数据行一致；
+- 界面路径的结果必须与直接渲染完全一致；
+- 分别记录冷渲染与热渲染耗时，直接渲染用例另记录冷启动时的预编译耗时。
+另有自检用例：修改模板的删除线设置后与原参考图比对，比对必须失败，用来确认比对足够灵敏。
+模板库用例 (library-*) 在临时目录中检查 TemplateLibrary 的保存/读取/索引、库外修改模板文件后重新计算哈希、
+非法模板ID的拒绝，以及界面切换模板 (元素结构相同与不同两种情况) 后的渲染结果与按模板ID渲染一致。
+结果写入 regression/output/report.json (每次运行前清空该目录)，失败用例的实际图像和差异图也保存在该目录。
+
+全部使用 regression/fonts 中自带的字体，无需图形界面，可在 Linux 无头环境下运行：
+    python render_regression.py            # 比对
+    python render_regression.py --update   # 重新生成参考图
+"""
+import argparse
+import copy
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tkinter as tk
+from PIL import Image, ImageChops
+from barcode.charsets import code128
+
+from main import DEFAULT_CONFIG, StickerGenerator, TemplateLibrary, clear_render_caches, compile_template, render_compiled_template, template_hash
+
+REGRESSION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "regression")
+TEMPLATES_DIR = os.path.join(REGRESSION_DIR, "templates")
+GOLDEN_DIR = os.path.join(REGRESSION_DIR, "golden")
+OUTPUT_DIR = os.path.join(REGRESSION_DIR, "output")
+ROWS_FILE = os.path.join(REGRESSION_DIR, "rows.json")
+FONT_DIR = os.path.join(REGRESSION_DIR, "fonts")
+COLD_RUNS = 2 # 每个用例清空缓存后渲染的次数
+
+# 模板中的字体名统一映射到自带字体，保证不同机器上结果一致
+# StickerTestGothic 是 IPAex ゴシック 的子集 (见 regression/fonts/make_test_font.py)，含用例中的全部日文字符
+TEST_FONT_MAP = {"Meiryo": os.path.join(FONT_DIR, "StickerTestGothic.ttf"), "Impact": os.path.join(FONT_DIR, "DejaVuSans-Bold.ttf")}
+TEST_FALLBACK_FONT = TEST_FONT_MAP["Meiryo"]
+
+# --- Code128 解码 ---
+def _runs_of(bits):
+    """连续相同位的长度：'11011001100' -> (2, 1, 2, 2, 2, 2)"""
+    runs, count = [], 1
+    for prev, cur in zip(bits, bits[1:]):
+        if cur == prev: count += 1
+        else: runs.append(count); count = 1
+    runs.append(count)
+    return tuple(runs)
+
+CODE128_PATTERNS = [_runs_of(bits) for bits in code128.CODES]
+CODE128_STOP = _runs_of(code128.STOP + "11") # 终止符末尾还有 2 个模块宽的条
+_CODESET_CHARS = {
+    "A": {v: k for k, v in code128.A.items()},
+    "B": {v: k for k, v in code128.B.items()},
+}
+
+def _edges(widths):
+    """相邻条、空宽度之和 (边到边距离)。缩放和阈值化使条整体变宽或变窄时，它们基本不受影响"""
+    return tuple(a + b for a, b in zip(widths, widths[1:]))
+
+def _match_symbol(widths, patterns):
+    """
+    把一组条/空宽度按总宽归一化后与所有码型比较，返回误差最小的码值。
+    误差以边到边距离为主，条/空宽度只用于区分边到边距离相近的码型。
+    """
+    unit = sum(widths) / sum(patterns[0])
+    modules = [w / unit for w in widths]
+    edges = _edges(modules)
+    best, best_err = None, None
+    for value, pattern in enumerate(patterns):
+        err = sum((m - p) ** 2 for m, p in zip(edges, _edges(pattern))) + 0.25 * sum((m - p) ** 2 for m, p in zip(modules, pattern))
+        if best_err is None or err < best_err: best, best_err = value, err
+    return best if best_err < 1.5 else None
+
+def _bar_widths(pixels):
+    """按灰度 128 在相邻像素间线性插值求出亚像素级的边缘位置，返回从第一条条开始的各条/空宽度"""
+    crossings = []
+    for i in range(len(pixels) - 1):
+        a, b = pixels[i], pixels[i + 1]
+        if (a < 128) != (b < 128): crossings.append(i + (a - 128) / (a - b))
+    if pixels and pixels[0] < 128: return [] # 条码左侧必须有空白区
+    return [b - a for a, b in zip(crossings, crossings[1:])]
+
+def decode_code128_row(pixels):
+    """解码一行灰度像素 (0-255) 中的 Code128 条码，失败返回 None"""
+    runs = _bar_widths(pixels)
+    if len(runs) < 6 * 3 + 7 or (len(runs) - 7) % 6: return None
+    if _match_symbol(runs[-7:], [CODE128_STOP]) is None: return None
+    values = []
+    for i in range(0, len(runs) - 7, 6):
+        value = _match_symbol(runs[i:i + 6], CODE128_PATTERNS)
+        if value is None: return None
+        values.append(value)
+    *values, check = values
+    if values[0] not in code128.START_CODES.values(): return None
+    if check != (values[0] + sum(i * v for i, v in enumerate(values[1:], 1))) % 103: return None
+    codeset = {v: k for k, v in code128.START_CODES.items()}[values[0]]
+    text = []
+    for value in values[1:]:
+        if codeset == "C":
+            if value < 100: text.append(f"{value:02d}")
+            elif value == 100: codeset = "B"
+            elif value == 101: codeset = "A"
+            continue
+        if value == 99: codeset = "C"
+        elif value == 100 and codeset == "A": codeset = "B"
+        elif value == 101 and codeset == "B": codeset = "A"
+        elif value < 96: text.append(_CODESET_CHARS[codeset][value])
+    return "".join(text)
+
+def decode_barcode(image, bbox, samples=5):
+    """在条码区域内取若干水平扫描线解码，返回第一条成功的结果"""
+    gray = image.convert("L")
+    x1, y1, x2, y2 = (int(v) for v in bbox)
+    x1, x2 = max(x1, 0), min(x2, gray.width)
+    for i in range(1, samples + 1):
+        y = y1 + (y2 - y1) * i // (samples + 1)
+        if not 0 <= y < gray.height: continue
+        result = decode_code128_row(gray.crop((x1, y, x2, y + 1)).tobytes())
+        if result is not None: return result
+    return None
+
+# --- 像素比对 ---
+def pixel_diff(actual, expected, threshold):
+    """返回 (差异像素比例, 差异图)；任一通道差值超过 threshold 的像素计为差异"""
+    if actual.size != expected.size: return 1.0, None
+    channels = ImageChops.difference(actual.convert("RGBA"), expected.convert("RGBA")).split()
+    diff = channels[0]
+    for channel in channels[1:]: diff = ImageChops.lighter(diff, channel)
+    mismatched = sum(diff.histogram()[threshold + 1:])
+    return mismatched / (actual.width * actual.height), diff
+
+# --- 界面路径 ---
+_tcl = None
+
+def build_gui_adapter(template_data, row):
+    """
+    不创建窗口，按 init_data / load_template 的方式准备界面变量，
+    使 _generate_pillow_image 和 _collect_template_data 走与界面完全相同的代码。
+    """
+    global _tcl
+    if _tcl is None: _tcl = tk.Tcl()
+    app = StickerGenerator.__new__(StickerGenerator)
+    app.font_map = dict(TEST_FONT_MAP)
+    app.available_jp_fonts, app.available_impact_fonts = ["Meiryo"], ["Impact"]
+    config, elements = template_data['config'], copy.deepcopy(template_data['elements'])
+    info = dict(template_data['info'], **row)
+    app.data = {"info": info, "config": dict(config), "elements": elements}
+    app.vars = {key: tk.StringVar(_tcl, value=str(val)) for key, val in info.items()}
+    app.config_vars = {
+        "jp_font": tk.StringVar(_tcl, value=config['jp_font']),
+        "impact_font": tk.StringVar(_tcl, value=config['impact_font']),
+        "tax_rate": tk.DoubleVar(_tcl, value=config['tax_rate']),
+        "strikethrough": tk.BooleanVar(_tcl, value=config['strikethrough']),
+        "price_area_color": tk.StringVar(_tcl, value=config['price_area_color']),
+        "export_width": tk.StringVar(_tcl, value=str(config['export_width'])),
+        "export_height": tk.StringVar(_tcl, value=str(config['export_height'])),
+        "show_border": tk.BooleanVar(_tcl, value=config['show_border'])
+    }
+    app.element_vars = {key: {
+            'x': tk.StringVar(_tcl, value=str(val['pos'][0])), 'y': tk.StringVar(_tcl, value=str(val['pos'][1])),
+            'w': tk.StringVar(_tcl, value=str(val['size'][0])), 'h': tk.StringVar(_tcl, value=str(val['size'][1])),
+            'font_size': tk.StringVar(_tcl, value=str(val['font_size'])),
+            'line_spacing': tk.StringVar(_tcl, value=str(val.get('line_spacing', 1.0))),
+            'vertical': tk.StringVar(_tcl, value="竖排" if val.get('vertical') else "横排")
+        } for key, val in elements.items()}
+    return app
+
+def _invalid_tax_rate(app):
+    """税率输入框中是无法解析的文字：DoubleVar.get() 抛出 TclError，价格按 0 计算"""
+    app.config_vars['tax_rate'].set("abc")
+
+def _invalid_element_values(app):
+    """元素坐标、字号、行距为无效文字：对应元素被跳过，行距回退为 1.0"""
+    app.element_vars['title']['x'].set("abc")
+    app.element_vars['list_price']['font_size'].set("")
+    app.element_vars['cat1']['vertical'].set("竖排")
+    app.element_vars['cat1']['line_spacing'].set("x")
+
+# 界面路径专用用例：(用例名, 模板, 数据行, 对界面变量的修改)
+GUI_FALLBACK_CASES = [
+    ("invalid_tax_rate", "standard", "jp", _invalid_tax_rate),
+    ("invalid_element_values", "standard", "ascii", _invalid_element_values),
+]
+
+def _flip_strikethrough(template_data):
+    template_data['config']['strikethrough'] = not template_data['config']['strikethrough']
+
+# 自检用例：(用例名, 模板, 数据行, 对模板的修改)，修改后的渲染结果必须与原参考图比对失败
+SELF_CHECK_CASES = [
+    ("strikethrough", "standard", "jp", _flip_strikethrough),
+]
+
+# --- 模板库 ---
+def _direct_render(template_data, info=None):
+    return render_compiled_template(compile_template(template_data, TEST_FONT_MAP, TEST_FALLBACK_FONT), info)
+
+def _same_render(a, b):
+    return a[0].tobytes() == b[0].tobytes() and a[1] == b[1]
+
+def _library_round_trip(library, templates, rows):
+    """保存后重新打开模板库，列表、内容、哈希和渲染结果都应与原模板一致，且不留下临时文件"""
+    failures = []
+    template_data = templates["custom_text"]
+    library.save("custom_text", template_data)
+    reopened = TemplateLibrary(library.root_dir)
+    if reopened.list_templates() != ["custom_text"]: failures.append(f"重新打开后模板列表为 {reopened.list_templates()}")
+    if reopened.load("custom_text") != template_data: failures.append("读回的模板与保存的不一致")
+    if reopened.content_hash("custom_text") != template_hash(template_data): failures.append("索引中的内容哈希不正确")
+    if sorted(os.listdir(library.root_dir)) != ["custom_text.json", TemplateLibrary.INDEX_FILE]: failures.append(f"模板库目录中有多余文件: {os.listdir(library.root_dir)}")
+    if not _same_render(reopened.render("custom_text", TEST_FONT_MAP, TEST_FALLBACK_FONT, rows["jp"]), _direct_render(template_data, rows["jp"])):
+        failures.append("按模板ID渲染与直接渲染结果不一致")
+    return failures
+
+def _library_external_edit(library, templates, rows):
+    """在库外改写模板文件后，内容哈希、索引和渲染结果都应反映新内容"""
+    failures = []
+    library.save("standard", templates["standard"])
+    old_hash = library.content_hash("standard")
+    before = library.render("standard", TEST_FONT_MAP, TEST_FALLBACK_FONT, rows["jp"])
+    edited = copy.deepcopy(templates["standard"])
+    edited['config']['strikethrough'] = not edited['config']['strikethrough']
+    with open(os.path.join(library.root_dir, "standard.json"), 'w', encoding='utf-8') as f:
+        json.dump(edited, f, ensure_ascii=False, indent=4)
+    new_hash = library.content_hash("standard")
+    if new_hash == old_hash or new_hash != template_hash(edited): failures.append("库外修改后内容哈希未更新")
+    if TemplateLibrary(library.root_dir).index["templates"]["standard"]["hash"] != new_hash: failures.append("库外修改后索引文件未更新")
+    after = library.render("standard", TEST_FONT_MAP, TEST_FALLBACK_FONT, rows["jp"])
+    if _same_render(after, before) or not _same_render(after, _direct_render(edited, rows["jp"])): failures.append("库外修改后渲染结果仍为旧模板")
+    return failures
+
+def _library_rejected_id(library, templates, rows):
+    """非法的模板ID必须抛出 ValueError 且不写入任何文件；不存在的ID抛出带ID的 KeyError"""
+    failures = []
+    for template_id in ("abc\n", "../outside", "a/b", "a b", "abc.json", ""):
+        try:
+            library.save(template_id, templates["standard"])
+            failures.append(f"模板ID {template_id!r} 未被拒绝")
+        except ValueError: pass
+    written = os.listdir(os.path.dirname(library.root_dir))
+    if written: failures.append(f"拒绝的模板ID仍写入了文件: {written}")
+    try:
+        library.render("missing", TEST_FONT_MAP, TEST_FALLBACK_FONT)
+        failures.append("不存在的模板ID未抛出 KeyError")
+    except KeyError as e:
+        if "missing" not in str(e): failures.append(f"KeyError 信息中没有模板ID: {e}")
+    return failures
+
+def _library_switch(start_template, expect_rebuild):
+    """
+    界面先载入 start_template 并关闭边界线，再切换到缺少 show_border 和导出尺寸的库模板：
+    缺少的配置项应恢复为默认值，界面渲染结果应与按模板ID渲染完全一致。
+    元素结构相同时复用现有输入行，不同时重建 (expect_rebuild)。
+    """
+    def check(library, templates, rows):
+        failures = []
+        saved = copy.deepcopy(templates["standard"])
+        for key in ("show_border", "export_width", "export_height"): del saved['config'][key]
+        library.save("standard", saved)
+        app = build_gui_adapter(templates[start_template], rows["jp"])
+        app.config_vars['show_border'].set(False)
+        # 无窗口环境下代替输入行、颜色样本和画布
+        rebuilt = []
+        app.template_library = library
+        app.pos_widgets, app.pos_row_frames = {}, {}
+        app.color_swatch = type("Swatch", (), {"config": lambda self, **kw: None})()
+        app._build_all_pos_rows = lambda: rebuilt.append(True)
+        app._update_canvas_size = lambda: None
+        app.switch_library_template("standard")
+        if bool(rebuilt) != expect_rebuild: failures.append("切换时" + ("未重建" if expect_rebuild else "重建了") + "输入行")
+        if not app.config_vars['show_border'].get(): failures.append("切换后 show_border 未恢复为默认值")
+        export_size = (app.config_vars['export_width'].get(), app.config_vars['export_height'].get())
+        if export_size != (str(DEFAULT_CONFIG['export_width']), str(DEFAULT_CONFIG['export_height'])): failures.append(f"切换后导出尺寸为 {export_size}，未恢复为默认值")
+        if list(app.element_vars) != list(saved['elements']): failures.append(f"切换后元素为 {list(app.element_vars)}")
+        if not _same_render(app._generate_pillow_image(), library.render("standard", TEST_FONT_MAP, TEST_FALLBACK_FONT)):
+            failures.append("切换后界面渲染结果与按模板ID渲染不一致")
+        return failures
+    return check
+
+# 模板库用例：(用例名, 检查函数)，检查函数接收临时目录中的空模板库，返回失败信息列表
+LIBRARY_CASES = [
+    ("round_trip", _library_round_trip),
+    ("external_edit", _library_external_edit),
+    ("rejected_id", _library_rejected_id),
+    ("switch_same_layout", _library_switch("standard_large", expect_rebuild=False)),
+    ("switch_new_layout", _library_switch("custom_text", expect_rebuild=True)),
+]
+
+def run_library_case(case_id, check, templates, rows):
+    clear_render_caches()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        try: failures = check(TemplateLibrary(os.path.join(tmp_dir, "library")), templates, rows)
+        except Exception as e: failures = [f"出现异常: {e!r}"]
+    return {"case": case_id, "failures": failures, "status": "failed" if failures else "passed"}
+
+# --- 用例 ---
+def load_fixtures():
+    """读取回归用的数据行和模板，返回 (rows, templates)"""
+    with open(ROWS_FILE, 'r', encoding='utf-8') as f:
+        rows = json.load(f)
+    templates = {}
+    for filename in sorted(os.listdir(TEMPLATES_DIR)):
+        if not filename.endswith(".json"): continue
+        with open(os.path.join(TEMPLATES_DIR, filename), 'r', encoding='utf-8') as f:
+            templates[filename[:-5]] = json.load(f)
+    return rows, templates
+
+def load_cases(rows, templates, name_filter=None):
+    """
+    返回用例列表，每个用例为 dict: id, via ('direct' / 'gui'), template, row, tweak, golden, expect_diff
+    expect_diff 为 True 的自检用例要求与参考图比对失败。
+    """
+    cases = []
+    for template_name, template_data in templates.items():
+        for row_name, row in rows.items():
+            golden = f"{template_name}-{row_name}"
+            cases.append({"id": golden, "via": "direct", "template": template_data, "row": row, "tweak": None, "golden": golden, "expect_diff": False})
+            cases.append({"id": f"gui-{golden}", "via": "gui", "template": template_data, "row": row, "tweak": None, "golden": golden, "expect_diff": False})
+    for case_name, template_name, row_name, tweak in GUI_FALLBACK_CASES:
+        case_id = f"gui-{case_name}"
+        cases.append({"id": case_id, "via": "gui", "template": templates[template_name], "row": rows[row_name], "tweak": tweak, "golden": case_id, "expect_diff": False})
+    for case_name, template_name, row_name, mutate in SELF_CHECK_CASES:
+        template_data = copy.deepcopy(templates[template_name])
+        mutate(template_data)
+        cases.append({"id": f"selfcheck-{case_name}", "via": "direct", "template": template_data, "row": rows[row_name], "tweak": None, "golden": f"{template_name}-{row_name}", "expect_diff": True})
+    return [case for case in cases if not name_filter or name_filter in case["id"]]
+
+def run_case(case, args):
+    case_id, template_data, row = case["id"], case["template"], case["row"]
+    result = {"case": case_id, "failures": []}
+    if case["via"] == "direct":
+        compiled = None
+        def cold_render():
+            nonlocal compiled
+            start = time.perf_counter()
+            compiled = compile_template(template_data, TEST_FONT_MAP, TEST_FALLBACK_FONT)
+            compile_times.append((time.perf_counter() - start) * 1000)
+            return render_compiled_template(compiled, row)
+        warm_render = lambda: render_compiled_template(compiled, row)
+    else:
+        app = build_gui_adapter(template_data, row)
+        if case["tweak"]: case["tweak"](app)
+        cold_render = warm_render = app._generate_pillow_image # 预编译发生在 _generate_pillow_image 内部，不单独计时
+
+    def timed(render):
+        start = time.perf_counter()
+        output = render()
+        return output, (time.perf_counter() - start) * 1000
+    compile_times, cold, warm = [], [], []
+    for _ in range(COLD_RUNS):
+        clear_render_caches()
+        cold.append(timed(cold_render))
+    for _ in range(args.repeat): warm.append(timed(warm_render))
+    if compile_times: result["compile_ms"] = round(compile_times[0], 3)
+    result["cold_ms"] = [round(t, 3) for _, t in cold]
+    warm_times = sorted(t for _, t in warm)
+    result["render_ms"] = {"min": round(warm_times[0], 3), "median": round(warm_times[len(warm_times) // 2], 3), "max": round(warm_times[-1], 3)}
+    image, bboxes = cold[0][0]
+    if any(other.tobytes() != image.tobytes() or other_bboxes != bboxes for (other, other_bboxes), _ in cold[1:]):
+        result["failures"].append("清空缓存后重复渲染结果不一致")
+    if any(other.tobytes() != image.tobytes() or other_bboxes != bboxes for (other, other_bboxes), _ in warm):
+        result["failures"].append("使用缓存的渲染结果与冷渲染不一致")
+    if case["via"] == "gui" and not case["tweak"]:
+        direct_image, direct_bboxes = render_compiled_template(compile_template(template_data, TEST_FONT_MAP, TEST_FALLBACK_FONT), row)
+        if direct_image.tobytes() != image.tobytes() or direct_bboxes != bboxes:
+            result["failures"].append("界面路径与直接渲染结果不一致")
+
+    expected_data = dict(template_data['info'], **row).get('barcode_data', '')
+    if expected_data:
+        decoded = decode_barcode(image, bboxes['barcode']) if 'barcode' in bboxes else None
+        result["barcode"] = decoded
+        if decoded != expected_data: result["failures"].append(f"条码解码结果为 {decoded!r}，应为 {expected_data!r}")
+
+    golden_path = os.path.join(GOLDEN_DIR, case["golden"] + ".png")
+    owns_golden = case["golden"] == case_id # 普通界面用例与直接渲染共用参考图，只由直接渲染用例更新
+    if args.update and owns_golden:
+        if not result["failures"]:
+            image.save(golden_path, 'PNG')
+            result["status"] = "updated"
+            return result
+    elif not os.path.exists(golden_path):
+        result["failures"].append("缺少参考图 (使用 --update 生成)")
+    else:
+        with Image.open(golden_path) as expected:
+            ratio, diff = pixel_diff(image, expected, args.threshold)
+        result["diff_ratio"] = round(ratio, 6)
+        if case["expect_diff"]:
+            if ratio <= args.tolerance: result["failures"].append(f"自检失败：修改后的渲染结果仍与参考图 {case['golden']} 比对通过")
+        elif ratio > args.tolerance:
+            result["failures"].append(f"差异像素比例 {ratio:.4%} 超过容差 {args.tolerance:.4%}")
+            if diff is not None: diff.point(lambda v: 255 if v > args.threshold else 0).save(os.path.join(OUTPUT_DIR, case_id + ".diff.png"))
+    if result["failures"]: image.save(os.path.join(OUTPUT_DIR, case_id + ".actual.png"), 'PNG')
+    result["status"] = "failed" if result["failures"] else "passed"
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="贴纸渲染回归测试")
+    parser.add_argument("--update", action="store_true", help="用当前渲染结果覆盖参考图")
+    parser.add_argument("--threshold", type=int, default=0, help="单个像素通道差值超过此值才计为差异 (0-255，默认 0 即要求完全一致)")
+    parser.add_argument("--tolerance", type=float, default=0.0, help="允许的差异像素比例 (默认 0)")
+    parser.add_argument("--repeat", type=int, default=3, help="每个用例在缓存已填充时的渲染次数 (用于确定性检查和计时)")
+    parser.add_argument("-k", "--filter", help="只运行ID中包含该字符串的用例")
+    args = parser.parse_args()
+    args.repeat = max(args.repeat, 1)
+
+    os.makedirs(GOLDEN_DIR, exist_ok=True)
+    shutil.rmtree(OUTPUT_DIR, ignore_errors=True) # 清除上次运行留下的失败图像，避免与本次报告混淆
+    os.makedirs(OUTPUT_DIR)
+    results = []
+    def report(result):
+        results.append(result)
+        timing = f"cold {result['cold_ms'][0]:8.2f} ms  warm {result['render_ms']['median']:8.2f} ms" if "cold_ms" in result else ""
+        print(f"{result['status']:>8}  {result['case']:<36} {timing:<33}  {'; '.join(result['failures'])}")
+    rows, templates = load_fixtures()
+    # 先跑直接渲染用例，使 --update 时共用的参考图先于界面用例写好
+    for case in sorted(load_cases(rows, templates, args.filter), key=lambda c: c["via"] != "direct"):
+        report(run_case(case, args))
+    for case_name, check in LIBRARY_CASES:
+        case_id = f"library-{case_name}"
+        if not args.filter or args.filter in case_id: report(run_library_case(case_id, check, templates, rows))
+    with open(os.path.join(OUTPUT_DIR, "report.json"), 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=4)
+    failed = [r for r in results if r["status"] == "failed"]
+    print(f"\n共 {len(results)} 个用例，失败 {len(failed)} 个。报告: {os.path.join(OUTPUT_DIR, 'report.json')}")
+    return 1 if failed or not results else 0
+
+if __name__ == '__main__':
+    sys.exit(main())